@@ -1,75 +1,125 @@
 import numpy as np
-from estimate_energy_level import *
+from scipy import signal
+from weighting import *
 
-def SPL_fast(x, Fs):
+def SPL_frames(x, Fs, C, N, weighting="Z", chunk_frames=4096):
+    '''
+    Computes the SPL of consecutive non-overlapping windows of N samples in a single
+    vectorized pass. Each window gives the same value as the reference implementation
+    estimate_energy_level.estimate_energy_level, which is not used by the analysis.
+    Multi-channel signals are framed along the first axis, so all channels are
+    processed at once. The frequency weighting is applied by an IIR filter whose
+    state is carried from one chunk of windows to the next.
+
+    Parameters:
+        x : np.ndarray
+            Input audio signal, of shape (samples,) or (samples, channels)
+        Fs : int
+            Sampling rate of x
+        C : float or np.ndarray
+            Calibration constant, or one calibration constant per channel
+        N : int
+            Length of each window in samples
+        weighting : str
+            Frequency weighting (A, C or Z)
+            Default: Z (unweighted)
+        chunk_frames : int
+            Number of windows transformed at once, which bounds the memory used
+    Returns:
+        SPL : np.ndarray
+            Array of SPL values, of shape (windows,) or (windows, channels)
+        windowTime : np.ndarray
+            Time values at the center of each window
+    '''
+    windowStart = np.arange(0, len(x) - N, N)   # start index for each window
+    windowTime = (1/Fs) * (windowStart + round((N - 1) / 2))    # times at the middle of each window
+    n_frames = len(windowStart)
+
+    # Number of FFT bins corresponding to the positive frequencies below Fs/2
+    n_bins = int(np.ceil(N / 2))
+
+    sos = weighting_sos(weighting, Fs)
+    if sos is not None:
+        zi = np.zeros((len(sos), 2) + x.shape[1:])   # filter state carried across chunks
+
+    SPL = np.zeros((n_frames,) + x.shape[1:])
+    for start in range(0, n_frames, chunk_frames):
+        stop = min(start + chunk_frames, n_frames)
+        chunk = np.asarray(x[start*N : stop*N], dtype=float)
+        if sos is not None:
+            chunk, zi = signal.sosfilt(sos, chunk, axis=0, zi=zi)
+        frames = chunk.reshape((stop - start, N) + x.shape[1:])
+
+        X = np.abs(np.fft.rfft(frames, axis=1))[:, :n_bins]
+        # Avoid log(0) issues, including the energy of weighted silence underflowing to 0
+        X = np.maximum(X, 1e-17)
+
+        total_energy = np.sum(X**2, axis=1) / n_bins
+        avg_energy = total_energy / ((1 / Fs) * N)
+        SPL[start:stop] = 10 * np.log10(avg_energy) + C
+
+    return SPL, windowTime
+
+def SPL_fast(x, Fs, weighting="Z"):
     '''
     Computes the mean of the Sound Pressure Level (SPL) using a fixed window duration
     and calibration constant. Used for processing calibration files.
 
     Parameters:
         x : np.ndarray
-            Input audio signal
+            Input audio signal, of shape (samples,) or (samples, channels)
         Fs : int
             Sampling rate of x
+        weighting : str
+            Frequency weighting (A, C or Z)
     Returns:
-        SPL_mean : float
-            Mean SPL over all windows of time 
+        SPL_mean : float or np.ndarray
+            Mean SPL over all windows of time, for each channel of x
     '''
     C = 50  # default calibration constant (dB)
     time_step = 0.05  # duration of each window in seconds
 
-    t = (1/Fs) * np.arange(len(x))  # time array
-    
     # Calculate the length of each window in samples
     N = int(np.ceil(time_step * Fs))
 
     # Round N up to the nearest power of 2
     N = 2**int(np.ceil(np.log2(N)))
 
-    windowStart = np.arange(0, len(x) - N, N)   # start index for each window
-    SPL = np.zeros(len(windowStart))
-    windowTime = t[windowStart + round((N - 1) / 2)]    # times at the middle of each window
-
-    SPL_partial = np.zeros(len(windowStart))
-
     # Calculate the SPL at each window
-    for i in range(len(windowStart)):
-        SPL[i] = estimate_energy_level(x[windowStart[i] : windowStart[i] + N], Fs, C)
-        SPL_partial[i] = SPL[i] * (windowTime[1] - windowTime[0])
+    SPL, windowTime = SPL_frames(x, Fs, C, N, weighting)
 
-    SPL_mean = np.sum(SPL_partial) / windowTime[-1]
+    SPL_mean = np.sum(SPL * (windowTime[1] - windowTime[0]), axis=0) / windowTime[-1]
 
     return SPL_mean
 
-def SPL_fast_C_TH(x, Fs, C, time_step):
+def SPL_fast_C_TH(x, Fs, C, time_step, weighting="Z"):
     '''
     Computes the mean of the Sound Pressure Level (SPL) using a custom window duration
     and calibration constant. Used for processing the monitoring file.
     Parameters:
         x : np.ndarray
-            Input audio signal
+            Input audio signal, of shape (samples,) or (samples, channels)
         Fs : int
             Sampling rate of x
+        C : float or np.ndarray
+            Calibration constant, or one calibration constant per channel
+        time_step : float
+            Duration of each window in seconds
+        weighting : str
+            Frequency weighting (A, C or Z)
     Returns:
-        SPL_mean : float
-            Mean SPL over all windows of time
+        SPL_mean : float or np.ndarray
+            Mean SPL over all windows of time, for each channel of x
         SPL : np.ndarray
-            Array of SPL values
+            Array of SPL values, of shape (windows,) or (windows, channels)
         windowTime:
             Time values at the center of each window
     '''
-    t = (1/Fs) * np.arange(len(x))  # time array
     N = int(time_step * Fs) # length of each window in samples
-    windowStart = np.arange(0, len(x)-N, N) # start index for each window
-    SPL = np.zeros(len(windowStart))
-    windowTime = t[windowStart + round((N - 1) / 2)]    # times at the middle of each window
-    SPL_partial = np.zeros(len(windowStart))
 
     # Calculate the SPL at each window
-    for i in range(len(windowStart)):
-        SPL[i] = estimate_energy_level(x[windowStart[i] : windowStart[i] + N], Fs, C)
-        SPL_partial[i] = SPL[i] * time_step
+    SPL, windowTime = SPL_frames(x, Fs, C, N, weighting)
 
-    SPL_mean = np.sum(SPL_partial) / windowTime[-1]
+    SPL_mean = np.sum(SPL * time_step, axis=0) / windowTime[-1]
 
     return SPL_mean, SPL, windowTime
\ No newline at end of file
@@ -1,33 +1,205 @@
 from spl_fast import *
 from praat_pitch import *
 from doses import *
+from report import *
+from episodes import *
+from audio_cache import *
+from streaming_stats import *
 import pandas as pd
 import os
 import matplotlib.pyplot as plt
 import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor
 
-def audioread(file):
+def audioread(file, all_channels=False, cache=None):
     '''
-    Custom function for reading audio files.
+    Custom function for reading audio files. Compressed files (see audio_cache.CACHED_FORMATS)
+    are decoded once and memory-mapped from the decoded-audio cache.
 
     Parameter:
         file : str 
             Path to the audio file
+        all_channels : bool
+            Boolean to indicate whether to keep all channels instead of the one with the highest RMS
+        cache : dict
+            Dictionary returned by audio_cache.cache_audio_files, so that files that
+            are already cached are not hashed and looked up again
     Returns:
         Fs : int 
             The sample rate of the audio file
         x : np.ndarray 
-            Audio data extracted from the channel with the highest RMS
+            Audio data extracted from the channel with the highest RMS,
+            or of shape (samples, channels) if all_channels is True
     '''
-    x, Fs = sf.read(file)
+    if cache is not None and file in cache:
+        return cache[file]
+    if os.path.splitext(file)[1] in CACHED_FORMATS:
+        return cached_audio(file, "all" if all_channels else None)
+
+    x, Fs = sf.read(file, always_2d=all_channels)
 
     # Check if audio is mono
-    if len(x.shape) == 1:
+    if len(x.shape) == 1 or all_channels:
         return Fs, x
     
     return Fs, x[:,np.argmax(np.mean(np.square(x), axis=0))]
 
-def analysis(cal_files, cal_levels, monitoring_file, gender, save_folder=""):
+def analyse_channel(audio, Fs, SPL, time_SPL_F0, gender, time_step, no_cal, results_directory, suffix="", weighting="Z"):
+    '''
+    Calculates the fundamental frequency (F0) and vocal doses of one channel of the
+    monitoring file from its SPL track, then saves the results in Excel files. The
+    streaming statistics of the voiced frames (see streaming_stats.py) are saved in
+    Voice_stats.npz, so that a cohort can be summarized without reloading every track.
+
+    Parameters:
+        audio : np.ndarray
+            Audio data of the channel
+        Fs : int
+            Sampling rate of audio
+        SPL : np.ndarray
+            Array of SPL values over time, as returned by SPL_fast_C_TH
+        time_SPL_F0 : np.ndarray
+            Time array corresponding to SPL values, in seconds
+        gender : str
+            Speaker's gender (male, female, other)
+        time_step : float
+            Time step of the SPL and F0 values, in seconds
+        no_cal : bool
+            Truth value for whether the data is calibrated
+        results_directory : str
+            Path to the folder where the results will be stored
+        suffix : str
+            Suffix appended to the names of the Excel files
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z), recorded in SPL_F0.xlsx
+    Returns:
+        time_SPL_F0 : np.ndarray
+            Time array corresponding to SPL and F0 values, in seconds
+        SPL : np.ndarray
+            Array of calculated SPL values over time
+        F0 : np.ndarray
+            Array of calculated F0 values over time
+        vocal_doses : pd.DataFrame
+            DataFrame containing the calculated vocal doses
+    '''
+    # Step 1: Setting gender-specific F0 range
+    if gender == "female":
+        f0min = 100
+        f0max = 400
+    elif gender == "male":
+        f0min = 50
+        f0max = 300
+    else:
+        f0min = 50
+        f0max = 400
+
+    # Step 2: Calculating F0 using Praat's algorithm
+    F0 = praat_pitch(audio, Fs, time_step, f0min, f0max)
+
+    # Step 3: Truncating time, SPL, F0 to the same length
+    lim = min(len(SPL), len(F0))
+    SPL = SPL[:lim]
+    time_SPL_F0 = time_SPL_F0[:lim]
+    F0 = F0[:lim]
+
+    # Keep the tracks before the adjustment and filtering for dose_sweep
+    SPL_raw = np.array(SPL)
+    F0_raw = np.array(F0)
+
+    # Step 4: Adjusting SPL based on the distance to the microphone
+    distance_cal = SPL_PARAMETERS["distance_cal"]
+    SPL=SPL-20*np.log(distance_cal/0.5)
+
+    # Step 5: Filtering out small values of SPL and F0
+    SPL = [0 if f < SPL_PARAMETERS["SPL_floor"] else f for f in SPL]
+    for i in range(len(F0)):
+        if SPL[i] < 1e-10 or F0[i] < 1e-10:
+            SPL[i] = 0
+            F0[i] = 0
+
+    # Step 6: Saving SPL and F0 data to an Excel file, along with the tracks before steps 4 and 5
+    results = {'Time' : time_SPL_F0, 'SPL' : SPL, 'F0' : F0, 'SPL_raw' : SPL_raw, 'F0_raw' : F0_raw}
+    df = pd.DataFrame(results)
+    settings = pd.DataFrame({'Setting' : ['Weighting', 'time_step', 'distance_cal', 'SPL_floor'],
+                             'Value' : [weighting, time_step, SPL_PARAMETERS["distance_cal"], SPL_PARAMETERS["SPL_floor"]]})
+    with pd.ExcelWriter(os.path.join(results_directory, "SPL_F0" + suffix + ".xlsx")) as writer:
+        df.to_excel(writer, index=False)
+        settings.to_excel(writer, sheet_name="Settings", index=False)
+
+    # Step 7: Building the phonation episode index and saving it to an Excel file
+    episodes = phonation_episodes(time_SPL_F0, SPL, F0, time_step)
+    episodes.to_excel(os.path.join(results_directory, "Episodes" + suffix + ".xlsx"), index=False)
+
+    # Step 8: Accumulating the statistics of the voiced frames and saving them to a .npz file
+    stats = voice_stats()
+    update_voice_stats(stats, SPL, F0)
+    save_voice_stats(stats, os.path.join(results_directory, "Voice_stats" + suffix + ".npz"))
+
+    # Step 9: Calulcating vocal doses and saving them to an Excel file
+    vocal_doses = pd.DataFrame()
+    doses_names = ['Dt', 'VLI', 'Dd', 'De', 'Dr', 'Dt_p', 'Dd_n', 'De_n', 
+                   'Dr_n', 'SPL_mean', 'F0_mean',  'SPL_sd', 'F0_sd', 'CPP']
+    vocal_doses.insert(0, "Doses", doses_names)
+    doses_values = doses(audio, Fs, time_SPL_F0, SPL, F0, gender, f0min, f0max, no_cal)
+    vocal_doses.insert(1, "Values", doses_values)
+    vocal_doses.to_excel(os.path.join(results_directory, "Doses" + suffix + ".xlsx"), index=False)
+
+    return time_SPL_F0, SPL, F0, vocal_doses
+
+def read_channel(source, k):
+    '''
+    Reads one channel of a multi-channel audio file without loading the other channels.
+
+    Parameters:
+        source : str
+            Path to a file of the decoded-audio cache (.npy), which is memory-mapped,
+            or to an uncompressed audio file, which is read block by block
+        k : int
+            Index of the channel
+    Returns:
+        x : np.ndarray
+            Audio data of the channel
+    '''
+    if os.path.splitext(source)[1] == ".npy":
+        return np.load(source, mmap_mode="r")[:,k]
+
+    with sf.SoundFile(source) as f:
+        x = np.empty(f.frames)
+        start = 0
+        for block in f.blocks(blocksize=BLOCK_FRAMES, always_2d=True):
+            x[start:start+len(block)] = block[:,k]
+            start += len(block)
+    return x[:start]
+
+def _analyse_channel_job(job):
+    '''
+    Reads one channel of the monitoring file with read_channel and passes it to
+    analyse_channel, so that analysis_channels only sends the path of the file
+    to the worker processes.
+    '''
+    source, k = job[:2]
+    audio = np.ascontiguousarray(read_channel(source, k))
+    return analyse_channel(audio, *job[2:])
+
+def results_folder(save_folder, monitoring_file):
+    '''
+    Creates the folder where the results of a monitoring file are stored.
+
+    Parameters:
+        save_folder : str
+            Path to the folder where the results folder is created
+        monitoring_file : str
+            Path to the monitoring file
+    Returns:
+        results_directory : str
+            Path to the results folder
+    '''
+    results_directory = os.path.join(save_folder, os.path.splitext(os.path.basename(monitoring_file))[0] + "_results")
+    if not os.path.exists(results_directory):
+        os.mkdir(results_directory)
+    return results_directory
+
+def analysis(cal_files, cal_levels, monitoring_file, gender, save_folder="", weighting="Z"):
     '''
     Performs acoustic analysis on calibration and monitoring files, and calculates
     sound pressure level (SPL), fundamental frequency (F0), and vocal doses, then saves
@@ -45,6 +217,9 @@ def analysis(cal_files, cal_levels, monitoring_file, gender, save_folder=""):
         save_folder : str
             Path to the folder where the results will be stored
             Default: current directory (used for debugging purposes)
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z)
+            Default: Z (unweighted)
     
     Returns:
         time_audio : np.ndarray
@@ -61,10 +236,13 @@ def analysis(cal_files, cal_levels, monitoring_file, gender, save_folder=""):
             DataFrame containing the calculated vocal doses
     '''
     # Step 1: Calibration
+    # Decode the compressed calibration and monitoring files into the cache in parallel
+    cache = cache_audio_files(list(cal_files) + [monitoring_file])
+
     calibration_constants = []
     for cal_file, cal_level in zip(cal_files, cal_levels):
-        Fs, calibration = audioread(cal_file)
-        SPL_mean = SPL_fast(calibration, Fs)
+        Fs, calibration = audioread(cal_file, cache=cache)
+        SPL_mean = SPL_fast(calibration, Fs, weighting)
         c = 50+cal_level-SPL_mean
         calibration_constants.append(c)
     
@@ -73,67 +251,179 @@ def analysis(cal_files, cal_levels, monitoring_file, gender, save_folder=""):
     C = np.mean(calibration_constants) if len(calibration_constants) != 0 else 50
 
     # Step 2: Monitoring File Analysis
-    Fs, audio = audioread(monitoring_file)
+    Fs, audio = audioread(monitoring_file, cache=cache)
     time_step = 0.05    # Time step in seconds
-    SPL_mean, SPL, time_SPL_F0 = SPL_fast_C_TH(audio,Fs,C,time_step)
+    SPL_mean, SPL, time_SPL_F0 = SPL_fast_C_TH(audio,Fs,C,time_step,weighting)
 
-    # Step 3: Setting gender-specific F0 range
-    if gender == "female":
-        f0min = 100
-        f0max = 400
-    elif gender == "male":
-        f0min = 50
-        f0max = 300
-    else:
-        f0min = 50
-        f0max = 400
+    # Step 3: Creating the results directory
+    results_directory = results_folder(save_folder, monitoring_file)
 
-    # Step 4: Calculating F0 using Praat's algorithm
-    F0 = praat_pitch(audio, Fs, time_step, f0min, f0max)
+    # Step 4: Calculating F0 and vocal doses, and saving the results
+    time_SPL_F0, SPL, F0, vocal_doses = analyse_channel(audio, Fs, SPL, time_SPL_F0, gender, time_step,
+                                                        len(calibration_constants)==0, results_directory,
+                                                        weighting=weighting)
 
-    # Step 5: Truncating time, SPL, F0 to the same length
-    lim = min(len(SPL), len(F0))
-    SPL = SPL[:lim]
-    time_SPL_F0 = time_SPL_F0[:lim]
-    F0 = F0[:lim]
+    # Step 5: Creating the time array corresponding to the monitoring data, in minutes
+    time_audio = np.arange(len(audio))/(Fs*60)
 
-    # Step 6: Adjusting SPL based on the distance to the microphone
-    distance_cal = 0.30
-    SPL=SPL-20*np.log(distance_cal/0.5)
+    return time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses
 
-    # Step 7: Filtering out small values of SPL and F0
-    SPL = [0 if f < 50 else f for f in SPL]
-    for i in range(len(F0)):
-        if SPL[i] < 1e-10 or F0[i] < 1e-10:
-            SPL[i] = 0
-            F0[i] = 0
-    
-    # Step 8: Creating the results directory
-    results_directory = os.path.join(save_folder, os.path.splitext(os.path.basename(monitoring_file))[0] + "_results")
-    if not os.path.exists(results_directory):
-        os.mkdir(results_directory)
+def analysis_channels(cal_files, cal_levels, monitoring_file, gender, save_folder="", processes=None, weighting="Z"):
+    '''
+    Performs the same analysis as analysis() on every channel of the monitoring file
+    instead of only the channel with the highest RMS. The SPL of all channels is calculated
+    in a single batched pass, and F0 and vocal doses are calculated for each channel in
+    parallel across processes. Each process reads its own channel with read_channel, from
+    the decoded-audio cache for compressed files or directly from uncompressed files.
+    The results of channel k are saved in Excel files suffixed with "_channel_k".
 
-    # Step 9: Saving SPL and F0 data to an Excel file
-    results = {'Time' : time_SPL_F0, 'SPL' : SPL, 'F0' : F0}
-    df = pd.DataFrame(results)
-    df.to_excel(os.path.join(save_folder, results_directory, "SPL_F0.xlsx"), index=False)
+    If a calibration file has as many channels as the monitoring file, each channel is
+    calibrated with the corresponding channel of the calibration file. Otherwise, the
+    channel of the calibration file with the highest RMS is used for all channels.
 
-    # Step 10: Calulcating vocal doses and saving them to an Excel file
-    vocal_doses = pd.DataFrame()
-    doses_names = ['Dt', 'VLI', 'Dd', 'De', 'Dr', 'Dt_p', 'Dd_n', 'De_n', 
-                   'Dr_n', 'SPL_mean', 'F0_mean',  'SPL_sd', 'F0_sd', 'CPP']
-    vocal_doses.insert(0, "Doses", doses_names)
-    doses_values = doses(audio, Fs, time_SPL_F0, SPL, F0, gender, f0min, f0max, len(calibration_constants)==0)
-    vocal_doses.insert(1, "Values", doses_values)
-    vocal_doses.to_excel(os.path.join(save_folder, results_directory, "Doses.xlsx"), index=False)
+    Parameters:
+        cal_files : list
+            List of paths to calibration audio files
+        cal_levels : list
+            List of calibration levels for each calibration file
+        monitoring_file : str
+            Path to the monitoring file to be analyzed
+        gender : str
+            Speaker's gender (male, female, other)
+        save_folder : str
+            Path to the folder where the results will be stored
+            Default: current directory (used for debugging purposes)
+        processes : int
+            Number of worker processes
+            Default: number of CPUs
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z)
+            Default: Z (unweighted)
+    Returns:
+        results : list
+            For each channel, a tuple (time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses)
+            as returned by analysis()
+    '''
+    # Step 1: Reading all channels of the monitoring file, compressed files are decoded once into the cache
+    cache = cache_audio_files(list(cal_files) + [monitoring_file], channel="all")
+    Fs, audio = audioread(monitoring_file, all_channels=True, cache=cache)
+    channels = audio.shape[1]
+    source = audio.filename if monitoring_file in cache else monitoring_file
 
-    # Step 11: Creating the time array corresponding to the monitoring data, in minutes
+    # Step 2: Calibration
+    calibration_constants = []
+    for cal_file, cal_level in zip(cal_files, cal_levels):
+        Fs_cal, calibration = audioread(cal_file, all_channels=True, cache=cache)
+        if calibration.shape[1] != channels:
+            calibration = calibration[:,np.argmax(np.mean(np.square(calibration), axis=0))]
+        SPL_mean = SPL_fast(calibration, Fs_cal, weighting)
+        c = 50+cal_level-SPL_mean
+        calibration_constants.append(np.broadcast_to(c, (channels,)))
+    C = np.mean(calibration_constants, axis=0) if len(calibration_constants) != 0 else 50
+
+    # Step 3: Calculating the SPL of all channels in a single pass
+    time_step = 0.05    # Time step in seconds
+    SPL_mean, SPL, time_SPL_F0 = SPL_fast_C_TH(audio,Fs,C,time_step,weighting)
+
+    # Step 4: Creating the results directory
+    results_directory = results_folder(save_folder, monitoring_file)
+
+    # Step 5: Calculating F0 and vocal doses of each channel in parallel, and saving the results
+    jobs = [(source, k, Fs, SPL[:,k], time_SPL_F0, gender, time_step,
+             len(calibration_constants)==0, results_directory, "_channel_" + str(k+1), weighting)
+            for k in range(channels)]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        channel_results = list(executor.map(_analyse_channel_job, jobs))
+
+    # Step 6: Creating the time array corresponding to the monitoring data, in minutes
     time_audio = np.arange(len(audio))/(Fs*60)
 
-    return time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses
+    return [(time_audio, audio[:,k]) + channel_results[k] for k in range(channels)]
+
+def display_channels(results, weighting="Z"):
+    """
+    Displays the plots of display_data for every channel analyzed by analysis_channels,
+    one window per channel.
+
+    Parameters:
+        results : list
+            List returned by analysis_channels
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z)
+    """
+    for k, (time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses) in enumerate(results):
+        # Keep the full waveform so that the interactive windows can be zoomed in
+        data = prepare_report_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses, weighting, max_points=len(audio))
+        fig = plt.figure(figsize=(12,10))
+        draw_panels(fig, data)
+        fig.suptitle("Channel " + str(k+1))
+
+    # Make sure that the app pauses until all plot windows are closed
+    plt.show(block=True)
 
 
-def display_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses):
+def batch_reports(subjects, save_folder, formats=("png",), processes=None):
+    '''
+    Analyzes the monitoring files of a cohort one after the other and renders their
+    reports in parallel with report.render_reports. Only the decimated report data
+    of each file is kept in memory between the analysis and the rendering. Monitoring
+    files of different subjects often share a name (e.g. subj01/day1.wav and
+    subj02/day1.wav), so the results of each subject are saved in a subfolder of
+    save_folder named after the subject. The report of each file is saved in its
+    results folder, and the render times are saved in Render_times.xlsx in save_folder.
+    The statistics of the voiced frames of each subject and of the whole cohort are
+    merged from the Voice_stats.npz files and saved in Cohort_stats.xlsx in save_folder.
+
+    Parameters:
+        subjects : list
+            List of dictionaries with the arguments of analysis() for each file
+            ("cal_files", "cal_levels", "monitoring_file", "gender" and optionally "weighting"),
+            and optionally the "name" of the subject's subfolder
+            Default name: Subject_<i>, where i is the position of the subject in the list, starting at 1
+        save_folder : str
+            Path to the folder where the results will be stored
+        formats : tuple
+            Output formats, any of "png", "svg" and "html"
+        processes : int
+            Number of worker processes used for rendering
+            Default: number of CPUs
+    Returns:
+        render_times : pd.DataFrame
+            DataFrame containing the render time of each report, in seconds
+    '''
+    names = [subject.get("name", "Subject_" + str(i+1)) for i, subject in enumerate(subjects)]
+    if len(set(names)) != len(names):
+        raise ValueError("Subject names must be unique, so that the results of each subject are saved separately.")
+
+    reports = []
+    stats_files = []
+    for name, subject in zip(names, subjects):
+        subject_folder = os.path.join(save_folder, name)
+        os.makedirs(subject_folder, exist_ok=True)
+        weighting = subject.get("weighting", "Z")
+        results = analysis(subject["cal_files"], subject["cal_levels"], subject["monitoring_file"],
+                           subject["gender"], subject_folder, weighting)
+        results_directory = results_folder(subject_folder, subject["monitoring_file"])
+        reports.append((prepare_report_data(*results, weighting), os.path.join(results_directory, "Report")))
+        stats_files.append(os.path.join(results_directory, "Voice_stats.npz"))
+
+    # Summarize the cohort from the saved statistics, without reloading the SPL and F0 tracks
+    summaries = [summarize_voice_stats(load_voice_stats(file)) for file in stats_files]
+    summaries.append(summarize_voice_stats(merge_voice_stats_files(stats_files)))
+    cohort_stats = pd.DataFrame(summaries)
+    cohort_stats.insert(0, "Subject", names + ["All"])
+    cohort_stats.to_excel(os.path.join(save_folder, "Cohort_stats.xlsx"), index=False)
+
+    times = render_reports(reports, formats, processes)
+
+    render_times = pd.DataFrame({"Subject" : names,
+                                 "File" : [subject["monitoring_file"] for subject in subjects],
+                                 "Render time (s)" : times})
+    render_times.to_excel(os.path.join(save_folder, "Render_times.xlsx"), index=False)
+    return render_times
+
+
+def display_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses, weighting="Z"):
     """
     Displays plots of the audio signal, SPL, F0, and vocal doses (defined in doses.py)
     in a 3x2 grid.
@@ -151,58 +441,14 @@ def display_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses):
             Array of calculated F0 values over time
         vocal_doses : pd.DataFrame
             DataFrame containing the calculated vocal doses
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z)
     """
-   # Set all values near 0 to NaN to prevent plotting them 
-    for i in range(len(SPL)):
-        if SPL[i] < 1e-17 or F0[i] < 1e-17:
-            SPL[i] = np.nan
-            F0[i] = np.nan
-
-    plt.figure(figsize=(12,10))
-
-    # Subplot 1: Table of vocal doses
-    plt.subplot(321)
-    plt.axis("off")
-    table = plt.table(cellText=vocal_doses.values, colLabels=vocal_doses.columns, loc='center')
-    table.scale(1,1.5)
-
-    # Subplot 2: Line plot of audio over time in minutes 
-    plt.subplot(322)
-    plt.plot(time_audio, audio)
-    plt.ylabel("Amplitude")
-    plt.xlabel("Time (m)")
-    plt.title("Audiowave")
-
-    # Subplot 3: Scatter plot of SPL over time in minutes
-    plt.subplot(323)
-    plt.plot(time_SPL_F0/60, SPL, 'r+')
-    plt.ylabel("SPL (dBA)")
-    plt.xlabel("Time (m)")
-    plt.title("SPL at 50 cm")
-
-    # Subplot 4: Histogram of SPL values
-    plt.subplot(324)
-    plt.hist(SPL, color="r")
-    plt.ylabel("# of measurements")
-    plt.xlabel("SPL (dBA)")
-    plt.title("SPL at 50 cm")
-
-    # Subplot 5: Scatter plot of F0 over time in minutes
-    plt.subplot(325)
-    plt.plot(time_SPL_F0/60, F0, 'c*')
-    plt.ylabel("Frequency (Hz)")
-    plt.xlabel("Time (m)")
-    plt.title("Fundamental Frequency")
-
-    # Subplot 6: Histogram of F0 values
-    plt.subplot(326)
-    plt.hist(F0, color="turquoise")
-    plt.ylabel("# of measurements")
-    plt.xlabel("Frequency (Hz)")
-    plt.title("Fundamental Frequency")
-
-    plt.tight_layout()
-    plt.subplots_adjust(bottom=0.075)
+    # Keep the full waveform so that the interactive window can be zoomed in
+    data = prepare_report_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses, weighting, max_points=len(audio))
+
+    fig = plt.figure(figsize=(12,10))
+    draw_panels(fig, data)
 
     # Make sure that the app pauses so that existing plot
     # window has to be closed to open a new one
@@ -0,0 +1,235 @@
+import numpy as np
+import os
+import hashlib
+import tempfile
+import time
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+
+# Compressed formats that are decoded once and cached as PCM
+CACHED_FORMATS = [".mp3", ".MP3"]
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".dosimetry_app_cache")
+CACHE_MAX_BYTES = 5*2**30   # Total size of the cache before the least recently used files are evicted
+BLOCK_FRAMES = 2**20        # Number of frames decoded at once
+TEMP_MAX_AGE = 24*3600      # Age in seconds after which a temporary decode file is considered abandoned
+
+def content_hash(file):
+    '''
+    Computes the SHA-256 hash of the content of a file, read in blocks.
+
+    Parameter:
+        file : str
+            Path to the file
+    Returns:
+        digest : str
+            Hexadecimal digest of the file content
+    '''
+    h = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(2**24), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_path(cache_dir, digest, Fs, loudest):
+    '''
+    Returns the path of a cached file. The sample rate and the channel with the highest
+    mean power are kept in the file name so that they are known without decoding the
+    original file.
+    '''
+    return os.path.join(cache_dir, digest + "_pcm_" + str(Fs) + "_" + str(loudest) + ".npy")
+
+def _find_cached(cache_dir, digest):
+    '''
+    Looks up a cached file by content hash. Returns the path, the sample rate and the
+    channel with the highest mean power, or (None, None, None) if it is not cached.
+    '''
+    prefix = digest + "_pcm_"
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and name.endswith(".npy"):
+                Fs, loudest = name[len(prefix):-len(".npy")].split("_")
+                return os.path.join(cache_dir, name), int(Fs), int(loudest)
+    return None, None, None
+
+def _decode(file, path):
+    '''
+    Decodes file block by block into a float32 .npy file at path, keeping all channels.
+    Returns the sample rate and the channel with the highest mean power, which is the
+    one kept by analysis.audioread.
+    '''
+    tmp_raw = path + ".raw"
+    try:
+        # Pass 1: decode all channels to a raw file while accumulating the power of each channel.
+        # The number of frames of a compressed file is only known once it is decoded.
+        n = 0
+        with sf.SoundFile(file) as f, open(tmp_raw, "wb") as raw:
+            Fs = f.samplerate
+            channels = f.channels
+            power = np.zeros(channels)
+            for block in f.blocks(blocksize=BLOCK_FRAMES, dtype="float32", always_2d=True):
+                raw.write(block.tobytes())
+                power += np.sum(np.square(block, dtype=np.float64), axis=0)
+                n += len(block)
+
+        # Pass 2: copy the decoded frames into the memory-mappable .npy file
+        decoded = np.memmap(tmp_raw, dtype=np.float32, mode="r", shape=(n, channels))
+        pcm = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(n, channels))
+        for start in range(0, n, BLOCK_FRAMES):
+            pcm[start:start+BLOCK_FRAMES] = decoded[start:start+BLOCK_FRAMES]
+        pcm.flush()
+        del pcm, decoded
+    finally:
+        if os.path.exists(tmp_raw):
+            os.remove(tmp_raw)
+    return Fs, int(np.argmax(power))
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=None):
+    '''
+    Removes the least recently used cached files until the cache fits in max_bytes.
+    Temporary files left by a decode that was killed (e.g. by closing the app) are
+    removed once they are older than TEMP_MAX_AGE. Younger ones may belong to a decode
+    in progress, so they are kept but counted in the size of the cache.
+
+    Parameters:
+        cache_dir : str
+            Path to the cache folder
+        max_bytes : int
+            Maximum total size of the cache, in bytes
+        keep : list
+            Paths to cached files that must not be removed, e.g. those used by the current analysis
+    '''
+    if not os.path.isdir(cache_dir):
+        return
+    keep = [os.path.abspath(path) for path in (keep or [])]
+    entries = []
+    temp_bytes = 0
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            # The file was renamed or removed by a concurrent decode
+            continue
+        if name.endswith(".tmp.npy") or name.endswith(".tmp.npy.raw"):
+            if now-st.st_mtime > TEMP_MAX_AGE:
+                try:
+                    os.remove(path)
+                    continue
+                except OSError:
+                    pass
+            temp_bytes += st.st_size
+        elif name.endswith(".npy"):
+            entries.append((st.st_mtime, st.st_size, name))
+
+    # The modification time is refreshed on every access, so the oldest entries are the least recently used
+    entries.sort()
+    total = temp_bytes+sum(size for _, size, _ in entries)
+    for _, size, name in entries:
+        if total <= max_bytes:
+            break
+        path = os.path.join(cache_dir, name)
+        if os.path.abspath(path) in keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # The file may still be memory-mapped by an analysis (e.g. on Windows)
+            continue
+        total -= size
+
+def cached_audio(file, channel=None, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, evict=True):
+    '''
+    Reads a compressed audio file through the decoded-audio cache. The file is
+    decoded once, with all its channels, into a float32 PCM file keyed by its
+    content hash, which later calls memory-map directly whatever the channel.
+
+    Parameters:
+        file : str
+            Path to the audio file
+        channel : int or str
+            Channel to return, or "all" to return all channels
+            Default: the channel with the highest mean power
+        cache_dir : str
+            Path to the cache folder
+        max_bytes : int
+            Maximum total size of the cache, in bytes
+        evict : bool
+            Boolean to indicate whether to evict old entries after decoding.
+            cache_audio_files evicts once for the whole batch instead.
+    Returns:
+        Fs : int
+            The sample rate of the audio file
+        x : np.memmap
+            Read-only audio data of the chosen channel, of shape (samples,),
+            or of shape (samples, channels) if channel is "all"
+    '''
+    digest = content_hash(file)
+    path, Fs, loudest = _find_cached(cache_dir, digest)
+
+    if path is None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Decode under a temporary name so that a failed decode never leaves a partial cache
+        # file. A killed decode leaves its temporary files behind, which evict_cache removes.
+        # The sample rate in the final name is only known once decoded.
+        fd, tmp = tempfile.mkstemp(suffix=".tmp.npy", dir=cache_dir)
+        os.close(fd)
+        try:
+            Fs, loudest = _decode(file, tmp)
+            path = _cache_path(cache_dir, digest, Fs, loudest)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        if evict:
+            evict_cache(cache_dir, max_bytes, keep=[path])
+    else:
+        os.utime(path)  # Mark the entry as recently used
+
+    x = np.load(path, mmap_mode="r")
+    if channel is None:
+        return Fs, x[:,loudest]
+    elif channel == "all":
+        return Fs, x
+    elif channel >= x.shape[1]:
+        raise ValueError("Channel " + str(channel) + " does not exist in " + os.path.basename(file) + ".")
+    return Fs, x[:,channel]
+
+def cache_audio_files(files, channel=None, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, workers=None,
+                      formats=CACHED_FORMATS):
+    '''
+    Decodes several audio files into the cache in parallel, e.g. the calibration
+    and monitoring files of an analysis. Files that are not in formats are skipped.
+    Old entries are evicted once all files are cached, never removing the entries
+    of this batch.
+
+    Parameters:
+        files : list
+            List of paths to audio files
+        channel : int or str
+            Channel to return, or "all" to return all channels
+            Default: the channel with the highest mean power
+        cache_dir : str
+            Path to the cache folder
+        max_bytes : int
+            Maximum total size of the cache, in bytes
+        workers : int
+            Number of files decoded at once
+            Default: chosen by ThreadPoolExecutor
+        formats : list
+            File extensions to cache. Uncompressed formats are read faster directly.
+            Default: CACHED_FORMATS
+    Returns:
+        cached : dict
+            Dictionary mapping each cached file to its (Fs, x) pair, as returned by cached_audio
+    '''
+    files = list(set(file for file in files if os.path.splitext(file)[1] in formats))
+
+    # libsndfile releases the GIL while decoding, so threads decode files concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda file: cached_audio(file, channel, cache_dir, max_bytes, evict=False), files))
+
+    evict_cache(cache_dir, max_bytes, keep=[x.filename for _, x in results])
+    return dict(zip(files, results))
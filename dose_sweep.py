@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import os
+from doses import *
+
+SWEEP_MAX_BYTES = 2**28   # Memory budget of the temporary arrays of dose_sweep
+SWEEP_TEMPORARIES = 12    # Number of (chunk_size, frames) float64 arrays alive at once in dose_sweep, with some margin
+
+def sweep_grid(gender, **values):
+    '''
+    Builds the Cartesian product of parameter values, filling the parameters that
+    are not swept with their defaults from DOSE_PARAMETERS and SPL_PARAMETERS.
+
+    Parameters:
+        gender : str
+            Speaker's gender (male, female, other), used to pick the default constants
+        **values : list
+            Values to sweep for each parameter, e.g. distance_cal=[0.2, 0.3, 0.4]
+    Returns:
+        grid : pd.DataFrame
+            One row per parameter set, one column per parameter
+    '''
+    defaults = dict(DOSE_PARAMETERS["male" if gender == "male" else "female"], **SPL_PARAMETERS)
+    for name in values:
+        if name not in defaults:
+            raise ValueError("Unknown dose model parameter: " + name)
+
+    axes = [np.atleast_1d(values.get(name, defaults[name])) for name in defaults]
+    mesh = np.meshgrid(*axes, indexing="ij")
+    return pd.DataFrame({name : m.ravel() for name, m in zip(defaults, mesh)})
+
+def dose_sweep(time, SPL, F0, grid, chunk_size=None):
+    '''
+    Evaluates the vocal doses (see doses.doses) for every parameter set of a grid
+    in a single broadcast pass over an already computed SPL/F0 track. Unlike
+    doses.doses, the dose values are always returned as numbers, and CPP is not
+    computed since it does not depend on the swept parameters.
+
+    Parameters:
+        time : np.ndarray
+            Time vector corresponding to SPL and F0 values
+        SPL : np.ndarray
+            Array of SPL values over time, in dB, before the distance adjustment
+            and the SPL floor of analysis.analyse_channel are applied
+            (the SPL_raw column of SPL_F0.xlsx)
+        F0 : np.ndarray
+            Array of F0 values over time, in Hz, before the frames below the SPL
+            floor are zeroed (the F0_raw column of SPL_F0.xlsx)
+        grid : pd.DataFrame
+            Parameter sets, as returned by sweep_grid
+        chunk_size : int
+            Number of parameter sets evaluated at once. About SWEEP_TEMPORARIES
+            float64 arrays of chunk_size times the length of the track are alive
+            at once, so the memory used grows with both.
+            Default: the largest chunk that keeps them within SWEEP_MAX_BYTES
+    Returns:
+        results : pd.DataFrame
+            The grid with one additional column per vocal dose
+    '''
+    time = np.asarray(time, dtype=float)
+    if chunk_size is None:
+        chunk_size = max(1, SWEEP_MAX_BYTES // (SWEEP_TEMPORARIES*8*len(time)))
+    SPL = np.asarray(SPL, dtype=float)[None, :]
+    F0 = np.asarray(F0, dtype=float)[None, :]
+    time_step = time[1]-time[0]
+    omega = np.pi*2*F0
+
+    # F0 only depends on the track, so its undefined values and reciprocal are computed once
+    F0_defined = F0 >= 1e-10
+    F0_inv = np.divide(1, F0, out=np.zeros_like(F0), where=F0_defined)
+
+    doses_names = ['Dt', 'VLI', 'Dd', 'De', 'Dr', 'Dt_p', 'Dd_n', 'De_n',
+                   'Dr_n', 'SPL_mean', 'F0_mean', 'SPL_sd', 'F0_sd']
+    values = np.zeros((len(grid), len(doses_names)))
+
+    for start in range(0, len(grid), chunk_size):
+        p = {name : grid[name].to_numpy(dtype=float)[start:start+chunk_size, None] for name in grid.columns}
+
+        # Steps 4 and 5 of analysis.analyse_channel
+        SPL_adj = SPL-20*np.log(p["distance_cal"]/0.5)
+        voiced = (SPL_adj >= p["SPL_floor"]) & (SPL_adj >= 1e-10) & F0_defined
+        SPL_v = np.where(voiced, SPL_adj, 0)
+        F0_v = np.where(voiced, F0, 0)
+
+        # Vocal fold models of doses.doses, masked to the voiced frames
+        Pth = 0.14+0.06*(F0/p["F0_ref"])**2
+        Pl_Pth = 10**((SPL_v-p["Pl_offset"])/p["Pl_scale"])
+        A = np.where(voiced, time_step*p["A_coef"]*np.sqrt(Pl_Pth/Pth), 0)
+        T = p["T_coef"]/(1+p["T_slope"]*np.sqrt(F0/p["F0_ref"]))
+        eta = p["eta_num"]*F0_inv
+
+        Dt = time_step*np.count_nonzero(voiced, axis=1)
+        VLI = time_step*np.sum(F0_v, axis=1)/1000
+        Dd = 4*time_step*np.sum(F0_v*A, axis=1)
+        De = 0.5*np.sum(eta*(A/T)**2*omega**2, axis=1)*time_step/1000
+        Dr = 4*np.pi*np.sum(np.where(voiced, 10**((SPL_v-120)/10), 0), axis=1)*1000*time_step
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values[start:start+chunk_size] = np.column_stack((
+                Dt, VLI, Dd, De, Dr,
+                100*Dt/(time[-1]-time[0]),
+                Dd/Dt, De/Dt, Dr/Dt,
+                time_step*np.sum(SPL_v, axis=1)/Dt,
+                time_step*np.sum(F0_v, axis=1)/Dt,
+                np.std(time_step*SPL_v, axis=1, ddof=1),
+                np.std(time_step*F0_v, axis=1, ddof=1)))
+
+    results = grid.reset_index(drop=True).copy()
+    for i, name in enumerate(doses_names):
+        results[name] = values[:, i]
+    return results
+
+def dose_sweep_file(file, grid, chunk_size=None):
+    '''
+    Runs dose_sweep on the tracks saved by analysis.analyse_channel.
+
+    Parameters:
+        file : str
+            Path to an SPL_F0.xlsx file
+        grid : pd.DataFrame
+            Parameter sets, as returned by sweep_grid
+        chunk_size : int
+            Number of parameter sets evaluated at once, see dose_sweep
+            Default: chosen by dose_sweep
+    Returns:
+        results : pd.DataFrame
+            The grid with one additional column per vocal dose
+    '''
+    df = pd.read_excel(file)
+    if "SPL_raw" not in df.columns or "F0_raw" not in df.columns:
+        raise ValueError(os.path.basename(file) + " does not contain the SPL_raw and F0_raw tracks. Please rerun the analysis.")
+    return dose_sweep(df["Time"], df["SPL_raw"], df["F0_raw"], grid, chunk_size)
@@ -1,6 +1,29 @@
 import numpy as np
 from cpp import *
 
+# Gender-specific constants of the vocal fold models used for Dd and De.
+# Genders other than "male" use the female constants.
+DOSE_PARAMETERS = {
+    "male" : {"F0_ref" : 120,       # Reference frequency (Hz) for Pth and T
+              "A_coef" : 0.016,     # Amplitude of oscillation coefficient
+              "T_coef" : 0.0158,    # Tension coefficient numerator
+              "T_slope" : 2.15,     # Tension coefficient slope
+              "eta_num" : 5.4,      # Efficiency factor numerator
+              "Pl_offset" : 72.48,  # SPL offset (dB) of the lung pressure mapping
+              "Pl_scale" : 27.3},   # SPL scale (dB) of the lung pressure mapping
+    "female" : {"F0_ref" : 190,
+                "A_coef" : 0.010,
+                "T_coef" : 0.01063,
+                "T_slope" : 1.69,
+                "eta_num" : 1.4,
+                "Pl_offset" : 72.48,
+                "Pl_scale" : 27.3}
+}
+
+# Constants used by analysis.analyse_channel to adjust and filter the SPL track
+SPL_PARAMETERS = {"distance_cal" : 0.30,    # Distance (m) between the mouth and the microphone
+                  "SPL_floor" : 50}         # SPL values (dB) below the floor are treated as unvoiced
+
 def doses(x, Fs, time, SPL, F0, gender, f0min, f0max, no_cal):
     '''
     Calculates vocal doses.
@@ -86,29 +109,21 @@ def doses(x, Fs, time, SPL, F0, gender, f0min, f0max, no_cal):
     VLI_partial=F0*time_step
     De_partial=np.zeros(n)
     Dr_partial=np.zeros(n)
+    p = DOSE_PARAMETERS["male" if gender == "male" else "female"]
 
     for i in range(n):
         # Skip if the current values of F0 or SPL are undefined
         if F0[i] < 1e-10 or SPL[i] < 1e-10:
             continue
 
-        if gender == "male":
-            Pth[i]=0.14+0.06*(F0[i]/120)**2
-            Pl[i]=Pth[i]+10**((SPL[i]-72.48)/27.3)
-            
-            A[i]=time_step*0.016*((Pl[i]-Pth[i])/Pth[i])**0.5
-            T[i]=0.0158/(1+2.15*(F0[i]/120)**0.5)
+        Pth[i]=0.14+0.06*(F0[i]/p["F0_ref"])**2
+        Pl[i]=Pth[i]+10**((SPL[i]-p["Pl_offset"])/p["Pl_scale"])
 
-            eta[i]=5.4/F0[i]
-        else:
-            Pth[i]=0.14+0.06*(F0[i]/190)**2
-            Pl[i]=Pth[i]+10**((SPL[i]-72.48)/27.3)
+        A[i]=time_step*p["A_coef"]*((Pl[i]-Pth[i])/Pth[i])**0.5
+        T[i]=p["T_coef"]/(1+p["T_slope"]*(F0[i]/p["F0_ref"])**0.5)
 
-            A[i]=time_step*0.010*((Pl[i]-Pth[i])/Pth[i])**0.5
-            T[i]=0.01063/(1+1.69*(F0[i]/190)**0.5)
+        eta[i]=p["eta_num"]/F0[i]
 
-            eta[i]=1.4/F0[i]
-        
         Dt_partial[i]= time_step
         De_partial[i]=eta[i]*(A[i]/T[i])**2*omega[i]**2*time_step/1000
         Dr_partial[i]=10**((SPL[i]-120)/10)*1000*time_step
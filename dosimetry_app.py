@@ -5,6 +5,7 @@ from analysis import *
 import os
 import threading
 import webbrowser
+import multiprocessing
 
 def gender_interface(user_input, root):
     '''
@@ -33,6 +34,29 @@ def gender_interface(user_input, root):
     other_entry = tk.Entry(frame, width=20, textvariable=None)
     other_entry.pack(side=tk.LEFT)
 
+def options_interface(user_input, root):
+    '''
+    GUI for the analysis options.
+
+    Parameters:
+        user_input : dict
+            Dictionary containing user input
+        root : tk.Frame
+            The root widget where this interface will be placed
+    '''
+    frame = tk.Frame(root)
+    frame.pack(anchor=tk.W)
+    all_channels = tk.Checkbutton(frame, text="Analyze every channel separately", variable=user_input["all_channels"])
+    all_channels.pack(side=tk.LEFT, padx=20, pady=5)
+
+    frame = tk.Frame(root)
+    frame.pack(anchor=tk.W)
+    label = tk.Label(frame, text="SPL frequency weighting:")
+    label.pack(side=tk.LEFT, padx=20, pady=5)
+    for text, value in [("A", "A"), ("C", "C"), ("Z (unweighted)", "Z")]:
+        button = tk.Radiobutton(frame, text=text, variable=user_input["weighting"], value=value)
+        button.pack(side=tk.LEFT)
+
 def calibration_interface(user_input, root):
     '''
     GUI for the "Add calibration" button
@@ -197,13 +221,20 @@ def error_check(user_input):
     else:
         # If plot lock is locked, a plot window is already open so prevent the analysis from running
         if not plot_lock.locked():
-            time_step, audio, windowTime, SPL, F0, vocal_doses = analysis(cal_files, cal_levels, monitoring, gender, save)
+            weighting = user_input["weighting"].get()
+            if user_input["all_channels"].get():
+                results = analysis_channels(cal_files, cal_levels, monitoring, gender, save, weighting=weighting)
+            else:
+                time_step, audio, windowTime, SPL, F0, vocal_doses = analysis(cal_files, cal_levels, monitoring, gender, save, weighting)
             message = "Analysis results have been saved under " + os.path.basename(save) + "."
             messagebox.showinfo(title="Data Saved", message=message)
 
             # Acquire the lock to prevent multiple plot windows
             plot_lock.acquire_lock()
-            display_data(time_step, audio, windowTime, SPL, F0, vocal_doses)
+            if user_input["all_channels"].get():
+                display_channels(results, weighting)
+            else:
+                display_data(time_step, audio, windowTime, SPL, F0, vocal_doses, weighting)
             plot_lock.release_lock()
         else:
             messagebox.showerror(title="Error", message="Please close the existing plot window before opening a new one.")
@@ -234,7 +265,9 @@ def setup():
                   "cal_levels":[],                      # List of calibration levels
                   "cal_files":[],                       # List of calibration files
                   "monitoring":tk.StringVar(value=""),  # Path to monitoring file
-                  "save_folder":tk.StringVar(value="")} # Path to save folder
+                  "save_folder":tk.StringVar(value=""), # Path to save folder
+                  "all_channels":tk.BooleanVar(value=False),    # Whether to analyze every channel separately
+                  "weighting":tk.StringVar(value="Z")}          # Frequency weighting of the SPL values
     
     # Create a global canvas widget, used for adding scrolling functionality 
     global canvas
@@ -254,6 +287,7 @@ def setup():
     frame = tk.Frame(main_frame)
     frame.pack(anchor=tk.W)
     upload_interface(user_input["save_folder"], "Save Folder", frame, dir=True)
+    options_interface(user_input, main_frame)
     next_button = tk.Button(main_frame, text="Submit", command=lambda:error_check(user_input))
     next_button.pack(side=tk.LEFT, padx=20, pady=10)
 
@@ -270,4 +304,9 @@ def setup():
     master.mainloop()
 
 plot_lock = threading.Lock()
-setup()
\ No newline at end of file
+
+# The guard keeps the worker processes of analysis_channels from opening the app,
+# and freeze_support lets them start from the PyInstaller executable
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    setup()
\ No newline at end of file
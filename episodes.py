@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+def phonation_episodes(time, SPL, F0, time_step=None):
+    '''
+    Segments the SPL and F0 tracks into a run-length encoded index of phonation
+    episodes and silence gaps. A frame is voiced when both its SPL and F0 are
+    non-zero (see step 5 of analysis.analyse_channel).
+
+    Parameters:
+        time : np.ndarray
+            Time vector corresponding to SPL and F0 values (window centers), in seconds
+        SPL : np.ndarray
+            Array of SPL values over time, in dB
+        F0 : np.ndarray
+            Array of F0 values over time, in Hz
+        time_step : float
+            Time step of the SPL and F0 values, in seconds
+            Default: inferred from time, which then needs at least 2 frames
+    Returns:
+        episodes : pd.DataFrame
+            One row per run of voiced or unvoiced frames, with columns:
+            voiced, start_frame, n_frames, start, end, duration (in seconds),
+            SPL_mean and F0_mean (NaN for silence gaps)
+    '''
+    time = np.asarray(time, dtype=float)
+    SPL = np.asarray(SPL, dtype=float)
+    F0 = np.asarray(F0, dtype=float)
+    n = len(time)
+    if time_step is None:
+        if n < 2:
+            raise ValueError("The time step cannot be inferred from fewer than 2 frames.")
+        time_step = time[1]-time[0]
+
+    columns = ['voiced', 'start_frame', 'n_frames', 'start', 'end', 'duration', 'SPL_mean', 'F0_mean']
+    voiced = (SPL > 1e-10) & (F0 > 1e-10)
+
+    # Frames where the voicing decision changes delimit the runs (no runs in an empty track)
+    change = np.flatnonzero(voiced[1:] != voiced[:-1]) + 1
+    starts = np.concatenate(([0], change)) if n > 0 else change
+    lengths = np.diff(np.concatenate((starts, [n])))
+    run_voiced = voiced[starts]
+
+    # Sum SPL and F0 within each run, then keep the means of the voiced runs only
+    SPL_mean = np.add.reduceat(SPL, starts) / lengths
+    F0_mean = np.add.reduceat(F0, starts) / lengths
+    SPL_mean[~run_voiced] = np.nan
+    F0_mean[~run_voiced] = np.nan
+
+    start = time[starts] - time_step/2
+    duration = lengths*time_step
+
+    return pd.DataFrame({'voiced' : run_voiced,
+                         'start_frame' : starts,
+                         'n_frames' : lengths,
+                         'start' : start,
+                         'end' : start+duration,
+                         'duration' : duration,
+                         'SPL_mean' : SPL_mean,
+                         'F0_mean' : F0_mean}, columns=columns)
+
+def long_episodes(episodes, min_duration):
+    '''
+    Selects the phonation episodes lasting longer than min_duration seconds.
+
+    Parameters:
+        episodes : pd.DataFrame
+            Episode index returned by phonation_episodes
+        min_duration : float
+            Minimum episode duration, in seconds
+    Returns:
+        long : pd.DataFrame
+            Voiced rows of the episode index longer than min_duration
+    '''
+    return episodes[episodes['voiced'] & (episodes['duration'] > min_duration)]
+
+def voicing_breaks(episodes):
+    '''
+    Returns the durations of the silence gaps that separate two phonation episodes.
+    Leading and trailing silences are not voicing breaks and are excluded.
+
+    Parameters:
+        episodes : pd.DataFrame
+            Episode index returned by phonation_episodes
+    Returns:
+        breaks : np.ndarray
+            Durations of the voicing breaks, in seconds
+    '''
+    voiced = episodes['voiced'].to_numpy()
+    duration = episodes['duration'].to_numpy()
+    inner = np.ones(len(voiced), dtype=bool)
+    if len(voiced) > 0:
+        inner[0] = False
+        inner[-1] = False
+    return duration[~voiced & inner]
+
+def voicing_break_distribution(episodes, bins=10):
+    '''
+    Computes the histogram of voicing break durations.
+
+    Parameters:
+        episodes : pd.DataFrame
+            Episode index returned by phonation_episodes
+        bins : int or np.ndarray
+            Number of bins or bin edges, passed to np.histogram
+    Returns:
+        counts : np.ndarray
+            Number of voicing breaks in each bin
+        edges : np.ndarray
+            Bin edges, in seconds
+    '''
+    return np.histogram(voicing_breaks(episodes), bins=bins)
@@ -1,5 +1,9 @@
 import numpy as np
 
+# Reference implementation of the SPL of a single window. The analysis uses
+# SPL_fast.SPL_frames, which computes the same value for every window at once;
+# this function is kept to check SPL_frames against.
+
 def estimate_energy_level(x, Fs, C):
     '''
     Computes the average energy level of an audio signal in dB.
@@ -0,0 +1,228 @@
+import numpy as np
+import os
+import io
+import time
+import base64
+import html
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+def decimate_waveform(time_audio, audio, max_points=20000):
+    '''
+    Reduces an audio waveform to a min/max envelope so that it can be plotted
+    without drawing every sample. The envelope keeps the visual extent of the
+    waveform while bounding the number of plotted points.
+
+    Parameters:
+        time_audio : np.ndarray
+            Time array corresponding to the audio data
+        audio : np.ndarray
+            Audio data
+        max_points : int
+            Maximum number of points in the decimated waveform
+    Returns:
+        time_dec : np.ndarray
+            Decimated time array
+        audio_dec : np.ndarray
+            Decimated audio data, alternating between the minimum and maximum
+            of each block
+    '''
+    time_audio = np.asarray(time_audio)
+    audio = np.asarray(audio)
+    if len(audio) <= max_points:
+        return time_audio, audio
+
+    # Two points (min and max) are kept per block, the last block holds the remaining samples
+    block = int(np.ceil(len(audio) / (max_points // 2)))
+    starts = np.arange(0, len(audio), block)
+    centers = np.minimum(starts + block//2, (starts + len(audio)) // 2)    # middle of each block
+
+    audio_dec = np.empty(2*len(starts))
+    audio_dec[0::2] = np.minimum.reduceat(audio, starts)
+    audio_dec[1::2] = np.maximum.reduceat(audio, starts)
+    time_dec = np.repeat(time_audio[centers], 2)
+
+    return time_dec, audio_dec
+
+def prepare_report_data(time_audio, audio, time_SPL_F0, SPL, F0, vocal_doses, weighting="Z", max_points=20000):
+    '''
+    Packs the results of analysis.analysis into a compact dictionary that can be
+    sent to a worker process for rendering. The waveform is decimated and unvoiced
+    SPL and F0 values are replaced with NaN.
+
+    Parameters:
+        time_audio : np.ndarray
+            Time array corresponding to the monitoring data, in minutes
+        audio : np.ndarray
+            Audio data corresponding to the monitoring file
+        time_SPL_F0 : np.ndarray
+            Time array corresponding to SPL and F0 values, in seconds
+        SPL : np.ndarray
+            Array of calculated SPL values over time
+        F0 : np.ndarray
+            Array of calculated F0 values over time
+        vocal_doses : pd.DataFrame
+            DataFrame containing the calculated vocal doses
+        weighting : str
+            Frequency weighting applied to the SPL values (A, C or Z), used in the axis labels
+        max_points : int
+            Maximum number of points kept from the waveform
+    Returns:
+        data : dict
+            Dictionary holding the decimated data used by draw_panels
+    '''
+    time_dec, audio_dec = decimate_waveform(time_audio, audio, max_points)
+
+    # Set all values near 0 to NaN to prevent plotting them
+    SPL = np.array(SPL, dtype=float)
+    F0 = np.array(F0, dtype=float)
+    unvoiced = (SPL < 1e-17) | (F0 < 1e-17)
+    SPL[unvoiced] = np.nan
+    F0[unvoiced] = np.nan
+
+    return {"time_audio" : time_dec,
+            "audio" : audio_dec,
+            "time_SPL_F0" : np.asarray(time_SPL_F0, dtype=float),
+            "SPL" : SPL,
+            "F0" : F0,
+            "weighting" : weighting,
+            "doses_columns" : list(vocal_doses.columns),
+            "doses_values" : vocal_doses.values.tolist()}
+
+def draw_panels(fig, data):
+    '''
+    Draws the vocal dose table, audio waveform, SPL and F0 plots in a 3x2 grid.
+    Shared by the interactive display and the headless reports.
+
+    Parameters:
+        fig : matplotlib.figure.Figure
+            Figure on which the panels are drawn
+        data : dict
+            Dictionary returned by prepare_report_data
+    '''
+    time_SPL_F0 = data["time_SPL_F0"]
+    SPL = data["SPL"]
+    F0 = data["F0"]
+    SPL_label = "SPL (dB" + data["weighting"] + ")"
+
+    # Subplot 1: Table of vocal doses
+    ax = fig.add_subplot(321)
+    ax.axis("off")
+    table = ax.table(cellText=data["doses_values"], colLabels=data["doses_columns"], loc='center')
+    table.scale(1,1.5)
+
+    # Subplot 2: Line plot of audio over time in minutes
+    ax = fig.add_subplot(322)
+    ax.plot(data["time_audio"], data["audio"])
+    ax.set_ylabel("Amplitude")
+    ax.set_xlabel("Time (m)")
+    ax.set_title("Audiowave")
+
+    # Subplot 3: Scatter plot of SPL over time in minutes
+    ax = fig.add_subplot(323)
+    ax.plot(time_SPL_F0/60, SPL, 'r+')
+    ax.set_ylabel(SPL_label)
+    ax.set_xlabel("Time (m)")
+    ax.set_title("SPL at 50 cm")
+
+    # Subplot 4: Histogram of SPL values
+    ax = fig.add_subplot(324)
+    ax.hist(SPL[~np.isnan(SPL)], color="r")
+    ax.set_ylabel("# of measurements")
+    ax.set_xlabel(SPL_label)
+    ax.set_title("SPL at 50 cm")
+
+    # Subplot 5: Scatter plot of F0 over time in minutes
+    ax = fig.add_subplot(325)
+    ax.plot(time_SPL_F0/60, F0, 'c*')
+    ax.set_ylabel("Frequency (Hz)")
+    ax.set_xlabel("Time (m)")
+    ax.set_title("Fundamental Frequency")
+
+    # Subplot 6: Histogram of F0 values
+    ax = fig.add_subplot(326)
+    ax.hist(F0[~np.isnan(F0)], color="turquoise")
+    ax.set_ylabel("# of measurements")
+    ax.set_xlabel("Frequency (Hz)")
+    ax.set_title("Fundamental Frequency")
+
+    fig.tight_layout()
+    fig.subplots_adjust(bottom=0.075)
+
+def render_report(data, out_path, formats=("png",)):
+    '''
+    Renders a report to disk using the non-interactive Agg backend.
+
+    Parameters:
+        data : dict
+            Dictionary returned by prepare_report_data
+        out_path : str
+            Path of the report without extension. One file is written per format.
+        formats : tuple
+            Output formats, any of "png", "svg" and "html"
+    Returns:
+        render_time : float
+            Time taken to render the report, in seconds
+    '''
+    start = time.perf_counter()
+
+    # Figure objects created without pyplot are not registered with the GUI,
+    # so rendering is safe from worker processes and threads
+    fig = Figure(figsize=(12,10))
+    FigureCanvasAgg(fig)
+    draw_panels(fig, data)
+
+    for fmt in formats:
+        if fmt in ("png", "svg"):
+            fig.savefig(out_path + "." + fmt, format=fmt)
+        elif fmt == "html":
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format="png")
+            image = base64.b64encode(buffer.getvalue()).decode("ascii")
+            rows = "".join("<tr>" + "".join("<td>" + html.escape(str(v)) + "</td>" for v in row) + "</tr>"
+                           for row in data["doses_values"])
+            header = "".join("<th>" + html.escape(str(c)) + "</th>" for c in data["doses_columns"])
+            title = html.escape(os.path.basename(out_path))
+            # Written as UTF-8 rather than the platform encoding, so that non-ASCII file names are kept
+            with open(out_path + ".html", "w", encoding="utf-8") as f:
+                f.write("<html><head><meta charset='utf-8'><title>" + title + "</title></head><body>"
+                        + "<h1>" + title + "</h1>"
+                        + "<table border='1'><tr>" + header + "</tr>" + rows + "</table>"
+                        + "<img src='data:image/png;base64," + image + "'/>"
+                        + "</body></html>")
+        else:
+            raise ValueError("Unsupported report format: " + fmt)
+
+    return time.perf_counter() - start
+
+def _render_report_job(job):
+    '''
+    Unpacks a (data, out_path, formats) job for render_reports.
+    '''
+    return render_report(*job)
+
+def render_reports(reports, formats=("png",), processes=None):
+    '''
+    Renders the reports of a whole cohort in parallel across processes.
+
+    Parameters:
+        reports : list
+            List of (data, out_path) tuples, where data is the dictionary returned
+            by prepare_report_data
+        formats : tuple
+            Output formats, any of "png", "svg" and "html"
+        processes : int
+            Number of worker processes
+            Default: number of CPUs
+    Returns:
+        render_times : list
+            Render time of each report, in seconds, in the order of reports
+    '''
+    out_paths = [out_path for _, out_path in reports]
+    if len(set(out_paths)) != len(out_paths):
+        raise ValueError("Several reports would be written to the same path.")
+
+    jobs = [(data, out_path, formats) for data, out_path in reports]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_render_report_job, jobs))
@@ -0,0 +1,263 @@
+import numpy as np
+
+def track_stats(lo, hi, bin_width):
+    '''
+    Creates an empty accumulator for the streaming statistics of one track (SPL or F0).
+    The accumulator holds the count, mean and sum of squared deviations (Welford)
+    and a fixed-bin histogram used for approximate percentiles.
+
+    Parameters:
+        lo : float
+            Lower edge of the histogram
+        hi : float
+            Upper edge of the histogram
+        bin_width : float
+            Width of the histogram bins, which bounds the error of the percentiles
+    Returns:
+        stats : dict
+            Empty accumulator
+    '''
+    n_bins = int(np.ceil((hi-lo)/bin_width))
+    return {"n" : 0,
+            "mean" : 0.0,
+            "M2" : 0.0,
+            "edges" : lo+bin_width*np.arange(n_bins+1),
+            "counts" : np.zeros(n_bins, dtype=np.int64),
+            "under" : 0,    # Number of values below the first edge
+            "over" : 0}     # Number of values above the last edge
+
+def _combine(stats, n, mean, M2):
+    '''
+    Combines the moments of stats with those of another sample (Chan et al.'s
+    parallel form of Welford's algorithm), in place.
+    '''
+    if n == 0:
+        return
+    total = stats["n"]+n
+    delta = mean-stats["mean"]
+    stats["mean"] += delta*n/total
+    stats["M2"] += M2+delta**2*stats["n"]*n/total
+    stats["n"] = total
+
+def update_track_stats(stats, x):
+    '''
+    Adds a chunk of values to an accumulator, in place.
+
+    Parameters:
+        stats : dict
+            Accumulator created by track_stats
+        x : np.ndarray
+            Chunk of values
+    '''
+    x = np.asarray(x, dtype=float)
+    if len(x) == 0:
+        return
+    mean = np.mean(x)
+    _combine(stats, len(x), mean, np.sum((x-mean)**2))
+
+    edges = stats["edges"]
+    stats["under"] += int(np.count_nonzero(x < edges[0]))
+    stats["over"] += int(np.count_nonzero(x > edges[-1]))
+    stats["counts"] += np.histogram(x, bins=edges)[0]
+
+def merge_track_stats(a, b):
+    '''
+    Merges two accumulators created with the same histogram edges.
+
+    Parameters:
+        a, b : dict
+            Accumulators created by track_stats
+    Returns:
+        stats : dict
+            New accumulator equivalent to having seen the values of both a and b
+    '''
+    if not np.array_equal(a["edges"], b["edges"]):
+        raise ValueError("Cannot merge statistics with different histogram bins.")
+    stats = {"n" : a["n"], "mean" : a["mean"], "M2" : a["M2"], "edges" : a["edges"],
+             "counts" : a["counts"]+b["counts"],
+             "under" : a["under"]+b["under"],
+             "over" : a["over"]+b["over"]}
+    _combine(stats, b["n"], b["mean"], b["M2"])
+    return stats
+
+def track_sd(stats):
+    '''
+    Returns the sample standard deviation (ddof=1) of an accumulator.
+    '''
+    return np.sqrt(stats["M2"]/(stats["n"]-1)) if stats["n"] > 1 else np.nan
+
+def track_percentiles(stats, q):
+    '''
+    Approximates percentiles from the histogram of an accumulator by linear
+    interpolation within bins. Values outside the histogram range are clipped
+    to its edges.
+
+    Parameters:
+        stats : dict
+            Accumulator created by track_stats
+        q : float or np.ndarray
+            Percentiles to compute, between 0 and 100
+    Returns:
+        p : float or np.ndarray
+            Approximate percentiles
+    '''
+    if stats["n"] == 0:
+        return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+
+    # Cumulative count at each edge, values below the histogram come first
+    cdf = stats["under"]+np.concatenate(([0], np.cumsum(stats["counts"])))
+    return np.interp(np.asarray(q)/100*stats["n"], cdf, stats["edges"])
+
+def track_histogram(stats, bins=10):
+    '''
+    Coarsens the histogram of an accumulator for display.
+
+    Parameters:
+        stats : dict
+            Accumulator created by track_stats
+        bins : int
+            Number of bins of the coarse histogram, spanning the non-empty bins
+    Returns:
+        counts : np.ndarray
+            Number of values in each coarse bin
+        edges : np.ndarray
+            Edges of the coarse bins
+    '''
+    nonzero = np.flatnonzero(stats["counts"])
+    if len(nonzero) == 0:
+        return np.zeros(bins, dtype=np.int64), np.linspace(stats["edges"][0], stats["edges"][-1], bins+1)
+    first, last = nonzero[0], nonzero[-1]+1
+    edges = stats["edges"]
+    coarse_edges = np.linspace(edges[first], edges[last], bins+1)
+
+    # Each fine bin is assigned to the coarse bin containing its center
+    centers = (edges[first:last]+edges[first+1:last+1])/2
+    counts = np.histogram(centers, bins=coarse_edges, weights=stats["counts"][first:last])[0]
+    return counts.astype(np.int64), coarse_edges
+
+def voice_stats(SPL_range=(0, 150), SPL_bin=0.1, F0_range=(0, 1000), F0_bin=1):
+    '''
+    Creates empty streaming statistics for the SPL and F0 tracks.
+
+    Parameters:
+        SPL_range : tuple
+            Range of the SPL histogram, in dB
+        SPL_bin : float
+            Width of the SPL histogram bins, in dB
+        F0_range : tuple
+            Range of the F0 histogram, in Hz
+        F0_bin : float
+            Width of the F0 histogram bins, in Hz
+    Returns:
+        stats : dict
+            Dictionary with one accumulator for each of "SPL" and "F0"
+    '''
+    return {"SPL" : track_stats(SPL_range[0], SPL_range[1], SPL_bin),
+            "F0" : track_stats(F0_range[0], F0_range[1], F0_bin)}
+
+def update_voice_stats(stats, SPL, F0):
+    '''
+    Adds a chunk of SPL and F0 frames to the statistics, in place. Only voiced
+    frames (non-zero SPL and F0, see step 5 of analysis.analyse_channel) are counted.
+
+    Parameters:
+        stats : dict
+            Statistics created by voice_stats
+        SPL : np.ndarray
+            Chunk of SPL values, in dB
+        F0 : np.ndarray
+            Chunk of F0 values, in Hz
+    '''
+    SPL = np.asarray(SPL, dtype=float)
+    F0 = np.asarray(F0, dtype=float)
+    voiced = (SPL > 1e-10) & (F0 > 1e-10)
+    update_track_stats(stats["SPL"], SPL[voiced])
+    update_track_stats(stats["F0"], F0[voiced])
+
+def merge_voice_stats(a, b):
+    '''
+    Merges the statistics of two segments, files or subjects.
+
+    Parameters:
+        a, b : dict
+            Statistics created by voice_stats
+    Returns:
+        stats : dict
+            Merged statistics
+    '''
+    return {track : merge_track_stats(a[track], b[track]) for track in ("SPL", "F0")}
+
+def summarize_voice_stats(stats, percentiles=(5, 50, 95)):
+    '''
+    Summarizes the statistics of the voiced frames.
+
+    Parameters:
+        stats : dict
+            Statistics created by voice_stats
+        percentiles : tuple
+            Percentiles to report
+    Returns:
+        summary : dict
+            Dictionary with the number of voiced frames, the mean, standard
+            deviation and approximate percentiles of SPL and F0
+            (e.g. "SPL_mean", "SPL_sd", "SPL_p50")
+    '''
+    summary = {"n_voiced" : stats["SPL"]["n"]}
+    for track in ("SPL", "F0"):
+        s = stats[track]
+        summary[track + "_mean"] = s["mean"] if s["n"] > 0 else np.nan
+        summary[track + "_sd"] = track_sd(s)
+        for q, p in zip(percentiles, np.atleast_1d(track_percentiles(s, percentiles))):
+            summary[track + "_p" + str(q)] = p
+    return summary
+
+def save_voice_stats(stats, file):
+    '''
+    Saves statistics created by voice_stats to a .npz file, so that the statistics
+    of several files can later be merged without reloading their frames.
+
+    Parameters:
+        stats : dict
+            Statistics created by voice_stats
+        file : str
+            Path to the .npz file
+    '''
+    np.savez(file, **{track + "_" + key : value for track in ("SPL", "F0") for key, value in stats[track].items()})
+
+def load_voice_stats(file):
+    '''
+    Loads statistics saved by save_voice_stats.
+
+    Parameter:
+        file : str
+            Path to the .npz file
+    Returns:
+        stats : dict
+            Statistics in the format of voice_stats
+    '''
+    with np.load(file) as saved:
+        return {track : {"n" : int(saved[track + "_n"]),
+                         "mean" : float(saved[track + "_mean"]),
+                         "M2" : float(saved[track + "_M2"]),
+                         "edges" : saved[track + "_edges"],
+                         "counts" : saved[track + "_counts"],
+                         "under" : int(saved[track + "_under"]),
+                         "over" : int(saved[track + "_over"])}
+                for track in ("SPL", "F0")}
+
+def merge_voice_stats_files(files):
+    '''
+    Loads and merges the statistics saved by save_voice_stats for several files,
+    e.g. the Voice_stats.npz files of the results folders of a cohort.
+
+    Parameter:
+        files : list
+            List of paths to .npz files
+    Returns:
+        stats : dict
+            Merged statistics
+    '''
+    stats = load_voice_stats(files[0])
+    for file in files[1:]:
+        stats = merge_voice_stats(stats, load_voice_stats(file))
+    return stats
